@@ -12,8 +12,11 @@ Requisitos:
 """
 
 import streamlit as st
-from streamlit_folium import st_folium
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import io
 import time
 from otimizador import (
     otimizar_rota,
@@ -61,6 +64,54 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# ==================== CACHE ====================
+# Cada st.rerun() reexecuta o script inteiro; o cache abaixo evita repetir o
+# solver para os mesmos pontos (as consultas ao OpenRouteService já ficam em
+# cache no disco dentro de `obter_rota_real`, e o mapa renderizado fica no
+# session state)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def otimizar_rota_cache(coords):
+    """Versão em cache de `otimizar_rota`, chaveada pelo array de coordenadas"""
+    return otimizar_rota(coords)
+
+
+# ==================== IMPORTAÇÃO/EXPORTAÇÃO ====================
+COLUNAS_PONTOS = ['nome', 'longitude', 'latitude']
+
+# Esquema fixo do CSV: evita a etapa de inferência de tipos
+ESQUEMA_CSV = {
+    'nome': pa.string(),
+    'longitude': pa.float64(),
+    'latitude': pa.float64()
+}
+
+
+def ler_csv_pontos(arquivo):
+    """
+    Lê o CSV de pontos com o parser multi-thread do PyArrow
+    
+    Returns:
+        pa.Table: Tabela com as colunas nome, longitude e latitude
+    
+    Raises:
+        ValueError: Se alguma coluna obrigatória estiver ausente
+    """
+    tabela = pacsv.read_csv(
+        arquivo,
+        convert_options=pacsv.ConvertOptions(column_types=ESQUEMA_CSV)
+    )
+    if not set(COLUNAS_PONTOS).issubset(tabela.schema.names):
+        raise ValueError("CSV deve ter colunas: nome, longitude, latitude")
+    return tabela.select(COLUNAS_PONTOS)
+
+
+@st.cache_data(show_spinner=False)
+def exportar_csv(pontos):
+    """Serializa os pontos em CSV; recalcula apenas quando os dados mudam"""
+    return pontos.to_csv(index=False).encode('utf-8')
+
+
 # ==================== INICIALIZAR SESSION STATE ====================
 if 'pontos' not in st.session_state:
     # Dados padrão (exemplo)
@@ -73,8 +124,11 @@ if 'pontos' not in st.session_state:
 if 'resultado' not in st.session_state:
     st.session_state.resultado = None
 
-if 'mapa_gerado' not in st.session_state:
-    st.session_state.mapa_gerado = None
+if 'mapa_html' not in st.session_state:
+    st.session_state.mapa_html = None
+
+if 'api_key' not in st.session_state:
+    st.session_state.api_key = ""
 
 # ==================== TÍTULO ====================
 st.markdown('<h1 class="main-header">🚜 Otimizador de Rotas Agrícolas</h1>', unsafe_allow_html=True)
@@ -88,13 +142,21 @@ with st.sidebar:
     
     st.divider()
     
-    # API Key
+    # API Key (em formulário: só reexecuta o script ao clicar em "Aplicar")
     st.subheader("🔑 API OpenRouteService")
-    api_key = st.text_input(
-        "Chave da API",
-        type="password",
-        help="Obtenha gratuitamente em: https://openrouteservice.org/dev/#/signup"
-    )
+    
+    with st.form("config"):
+        chave_digitada = st.text_input(
+            "Chave da API",
+            value=st.session_state.api_key,
+            type="password",
+            help="Obtenha gratuitamente em: https://openrouteservice.org/dev/#/signup"
+        )
+        
+        if st.form_submit_button("✔️ Aplicar", width="stretch"):
+            st.session_state.api_key = chave_digitada
+    
+    api_key = st.session_state.api_key
     
     if api_key:
         st.success("✅ API configurada")
@@ -137,23 +199,25 @@ with st.sidebar:
     uploaded_file = st.file_uploader("📁 Importar CSV", type=['csv'], help="Formato: nome,longitude,latitude")
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file)
-            if all(col in df.columns for col in ['nome', 'longitude', 'latitude']):
-                st.session_state.pontos = df
-                st.session_state.resultado = None
-                st.success(f"✅ {len(df)} pontos importados!")
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.error("❌ CSV deve ter colunas: nome, longitude, latitude")
+            df = ler_csv_pontos(uploaded_file).to_pandas()
+            st.session_state.pontos = df
+            st.session_state.resultado = None
+            st.success(f"✅ {len(df)} pontos importados!")
+            time.sleep(1)
+            st.rerun()
+        except pa.ArrowInvalid as e:
+            # Erros de leitura do Arrow também são ValueError: tratá-los antes
+            st.error(f"❌ Erro ao importar: {str(e)}")
+        except ValueError as e:
+            st.error(f"❌ {e}")
         except Exception as e:
             st.error(f"❌ Erro ao importar: {str(e)}")
     
     if len(st.session_state.pontos) > 0:
-        csv = st.session_state.pontos.to_csv(index=False).encode('utf-8')
+        pontos = st.session_state.pontos
         st.download_button(
             label="💾 Exportar Pontos (CSV)",
-            data=csv,
+            data=lambda: exportar_csv(pontos),
             file_name="pontos_rota.csv",
             mime="text/csv",
             use_container_width=True
@@ -228,7 +292,7 @@ with col2:
     if st.button("🗑️ Limpar Todos", type="secondary", use_container_width=True):
         st.session_state.pontos = pd.DataFrame(columns=['nome', 'longitude', 'latitude'])
         st.session_state.resultado = None
-        st.session_state.mapa_gerado = None
+        st.session_state.mapa_html = None
         st.rerun()
 
 st.markdown("---")
@@ -249,11 +313,10 @@ with col2:
                 try:
                     with st.spinner("⚙️ Otimizando rota... Aguarde..."):
                         
-                        # Preparar dados
-                        pontos_coordenadas = [
-                            [row['longitude'], row['latitude']] 
-                            for _, row in st.session_state.pontos.iterrows()
-                        ]
+                        # Preparar dados (colunas extraídas direto para NumPy, sem iterrows)
+                        lon = st.session_state.pontos['longitude'].to_numpy(dtype=np.float64)
+                        lat = st.session_state.pontos['latitude'].to_numpy(dtype=np.float64)
+                        coords = np.column_stack([lon, lat])
                         rotas_nomes = st.session_state.pontos['nome'].tolist()
                         
                         # Barra de progresso
@@ -263,21 +326,21 @@ with col2:
                         # Etapa 1: Otimizar com OR-Tools
                         status_text.text("🔍 Calculando rota otimizada...")
                         progress_bar.progress(33)
-                        sequencia, distancia = otimizar_rota(pontos_coordenadas)
+                        sequencia, distancia = otimizar_rota_cache(coords)
                         
                         # Etapa 2: Obter rota real
                         status_text.text("🗺️ Obtendo rota real via OpenRouteService...")
                         progress_bar.progress(66)
-                        pontos_otimizados = [pontos_coordenadas[i] for i in sequencia]
+                        pontos_otimizados = coords[sequencia].tolist()
                         caminhos = obter_rota_real(api_key, pontos_otimizados)
                         
                         # Etapa 3: Gerar mapa
                         status_text.text("🎨 Gerando mapa interativo...")
                         progress_bar.progress(90)
-                        mapa = gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia, caminhos)
+                        mapa = gerar_mapa(coords, rotas_nomes, sequencia, caminhos)
                         
                         # Calcular estatísticas
-                        stats = calcular_estatisticas_rota(pontos_coordenadas, sequencia, caminhos)
+                        stats = calcular_estatisticas_rota(coords, sequencia, caminhos)
                         
                         # Salvar resultado
                         st.session_state.resultado = {
@@ -288,7 +351,8 @@ with col2:
                             'sequencia_nomes': [rotas_nomes[i] for i in sequencia],
                             'stats': stats
                         }
-                        st.session_state.mapa_gerado = mapa
+                        # Renderizar o HTML uma única vez; os reruns apenas o reexibem
+                        st.session_state.mapa_html = mapa.get_root().render()
                         
                         progress_bar.progress(100)
                         status_text.text("✅ Concluído!")
@@ -308,8 +372,44 @@ with col2:
         st.warning("⚠️ São necessários pelo menos 2 pontos para otimizar")
 
 # ==================== RESULTADOS ====================
-if st.session_state.resultado and st.session_state.mapa_gerado:
+def montar_relatorio(resultado, sub):
+    """
+    Monta o relatório de texto da rota otimizada
+    
+    Args:
+        resultado: Dicionário de resultado salvo no session state
+        sub: Array com [nome, longitude, latitude] dos pontos na ordem da sequência
     
+    Returns:
+        str: Texto completo do relatório
+    """
+    cabecalho = f"""
+RELATÓRIO DE OTIMIZAÇÃO DE ROTA
+{'='*60}
+
+Data e Hora: {pd.Timestamp.now().strftime('%d/%m/%Y %H:%M:%S')}
+
+RESUMO DA ROTA:
+- Distância Total: {resultado['distancia_km']:.2f} km
+- Tempo Estimado: {resultado['tempo_horas']:.2f}h ({resultado['tempo_minutos']:.0f} minutos)
+- Número de Paradas: {len(resultado['sequencia'])}
+- Economia Estimada: 12% em combustível
+
+SEQUÊNCIA DE VISITAS:
+"""
+    buf = io.StringIO()
+    buf.write(cabecalho)
+    for i, nome in enumerate(resultado['sequencia_nomes'], 1):
+        buf.write(f"\n{i}. {nome}\n   Latitude: {sub[i - 1, 2]:.6f}\n   Longitude: {sub[i - 1, 1]:.6f}\n")
+    buf.write(f"\n{'='*60}\n")
+    buf.write("Otimizado por: Sistema de Rotas Agrícolas v1.0\n")
+    buf.write("Powered by: OR-Tools + OpenRouteService\n")
+    return buf.getvalue()
+
+
+@st.fragment
+def exibir_resultados():
+    """Exibe os resultados; interações aqui reexecutam apenas este fragmento"""
     st.markdown("---")
     st.subheader("📊 Resultados da Otimização")
     
@@ -353,12 +453,10 @@ if st.session_state.resultado and st.session_state.mapa_gerado:
     with tab1:
         st.markdown("### Visualização da Rota Otimizada")
         
-        # Exibir mapa usando streamlit-folium
-        st_folium(
-            st.session_state.mapa_gerado,
-            width=None,  # Largura total
-            height=600,  # Altura de 600px
-            returned_objects=[]
+        # Exibir o HTML já renderizado (sem reconstruir o mapa Folium a cada rerun)
+        st.iframe(
+            st.session_state.mapa_html,
+            height=600  # Altura de 600px
         )
         
         # Botões de ação
@@ -366,10 +464,9 @@ if st.session_state.resultado and st.session_state.mapa_gerado:
         
         with col1:
             # Botão para salvar HTML
-            mapa_html = st.session_state.mapa_gerado._repr_html_()
             st.download_button(
                 label="💾 Baixar Mapa (HTML)",
-                data=mapa_html,
+                data=st.session_state.mapa_html,
                 file_name="rota_otimizada.html",
                 mime="text/html",
                 use_container_width=True
@@ -382,10 +479,12 @@ if st.session_state.resultado and st.session_state.mapa_gerado:
     with tab2:
         st.markdown("### Sequência de Visitas Otimizada")
         
+        # Reunir os pontos na ordem da sequência de uma só vez
+        seq = np.asarray(resultado['sequencia'])
+        sub = st.session_state.pontos[COLUNAS_PONTOS].to_numpy()[seq]
+        
         # Mostrar sequência como tabela estilizada
-        for i, idx in enumerate(resultado['sequencia']):
-            nome = resultado['sequencia_nomes'][i]
-            ponto_original = st.session_state.pontos.iloc[idx]
+        for i, nome in enumerate(resultado['sequencia_nomes']):
             
             with st.container():
                 col1, col2, col3 = st.columns([1, 4, 2])
@@ -409,18 +508,17 @@ if st.session_state.resultado and st.session_state.mapa_gerado:
                         st.caption(f"Parada intermediária")
                 
                 with col3:
-                    st.caption(f"📍 Lat: {ponto_original['latitude']:.4f}")
-                    st.caption(f"📍 Lon: {ponto_original['longitude']:.4f}")
+                    st.caption(f"📍 Lat: {sub[i, 2]:.4f}")
+                    st.caption(f"📍 Lon: {sub[i, 1]:.4f}")
                 
                 st.divider()
         
         # Exportar sequência
-        df_sequencia = pd.DataFrame({
-            'ordem': range(1, len(resultado['sequencia_nomes']) + 1),
-            'nome': resultado['sequencia_nomes'],
-            'latitude': [st.session_state.pontos.iloc[idx]['latitude'] for idx in resultado['sequencia']],
-            'longitude': [st.session_state.pontos.iloc[idx]['longitude'] for idx in resultado['sequencia']]
-        })
+        df_sequencia = (
+            pd.DataFrame(sub, columns=COLUNAS_PONTOS)
+            .assign(ordem=np.arange(1, len(seq) + 1))
+            [['ordem', 'nome', 'latitude', 'longitude']]
+        )
         
         csv_sequencia = df_sequencia.to_csv(index=False).encode('utf-8')
         st.download_button(
@@ -460,41 +558,18 @@ if st.session_state.resultado and st.session_state.mapa_gerado:
         
         st.divider()
         
-        # Relatório completo em texto
-        relatorio_texto = f"""
-RELATÓRIO DE OTIMIZAÇÃO DE ROTA
-{'='*60}
-
-Data e Hora: {pd.Timestamp.now().strftime('%d/%m/%Y %H:%M:%S')}
-
-RESUMO DA ROTA:
-- Distância Total: {resultado['distancia_km']:.2f} km
-- Tempo Estimado: {resultado['tempo_horas']:.2f}h ({resultado['tempo_minutos']:.0f} minutos)
-- Número de Paradas: {len(resultado['sequencia'])}
-- Economia Estimada: 12% em combustível
-
-SEQUÊNCIA DE VISITAS:
-"""
-        for i, nome in enumerate(resultado['sequencia_nomes'], 1):
-            idx = resultado['sequencia'][i-1]
-            ponto = st.session_state.pontos.iloc[idx]
-            relatorio_texto += f"\n{i}. {nome}"
-            relatorio_texto += f"\n   Latitude: {ponto['latitude']:.6f}"
-            relatorio_texto += f"\n   Longitude: {ponto['longitude']:.6f}\n"
-        
-        relatorio_texto += f"\n{'='*60}\n"
-        relatorio_texto += "Otimizado por: Sistema de Rotas Agrícolas v1.0\n"
-        relatorio_texto += "Powered by: OR-Tools + OpenRouteService\n"
-        
-        # Botão para baixar relatório
+        # Relatório completo em texto (montado apenas ao clicar no botão)
         st.download_button(
             label="📝 Baixar Relatório Completo (TXT)",
-            data=relatorio_texto,
+            data=lambda: montar_relatorio(resultado, sub),
             file_name=f"relatorio_rota_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.txt",
             mime="text/plain",
             use_container_width=True
         )
 
+if st.session_state.resultado and st.session_state.mapa_html:
+    exibir_resultados()
+
 # ==================== FOOTER ====================
 st.markdown("---")
 col1, col2, col3 = st.columns(3)
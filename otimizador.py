@@ -12,26 +12,218 @@ Este módulo contém todas as funções necessárias para:
 
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
 import folium
-import math
+from folium import plugins
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from joblib import Memory
+from pathlib import Path
+import copy
+import hashlib
+import numpy as np
 import openrouteservice as ors
 
+try:
+    from numba import njit, prange
+    NUMBA_DISPONIVEL = True
+except ImportError:  # Numba é opcional: sem ele usamos apenas NumPy
+    NUMBA_DISPONIVEL = False
+
+
+# Cache em disco (endereçado pelo conteúdo dos argumentos) para as consultas ao ORS,
+# ao lado deste módulo e não no diretório de trabalho de quem o importa
+DIRETORIO_CACHE = Path(__file__).resolve().parent / '.ors_cache'
+memoria = Memory(DIRETORIO_CACHE, verbose=0)
+
+# Limites do cache do ORS: tamanho total em disco e validade de cada resposta
+LIMITE_CACHE_BYTES = '200M'
+VALIDADE_CACHE = timedelta(days=30)
+
+# Máximo de coordenadas por requisição directions no plano gratuito do ORS
+LIMITE_COORDENADAS_ORS = 50
+
+# Requisições simultâneas ao ORS quando a rota é dividida em trechos
+MAX_REQUISICOES_ORS = 8
+
+# Raio médio da Terra em metros
+RAIO_TERRA_M = 6371000.0
+
+# A partir deste número de pontos a matriz é calculada com Numba (se disponível)
+LIMITE_MATRIZ_NUMBA = 500
+
+# Até este número de pontos a rota é resolvida de forma exata (Held–Karp);
+# sem Numba o algoritmo roda em Python puro, então o limite é menor
+LIMITE_HELD_KARP = 16 if NUMBA_DISPONIVEL else 8
+
+# Acima deste número de paradas os marcadores são agrupados em cluster
+LIMITE_MARCADORES_INDIVIDUAIS = 200
+
+# Template do popup de cada parada (formatado uma vez por marcador)
+POPUP_PARADA_HTML = """
+        <div style="font-family: Arial; min-width: 150px;">
+            <h4 style="margin: 0; color: {cor};">Parada #{ordem}</h4>
+            <hr style="margin: 5px 0;">
+            <b>{nome}</b><br>
+            <small>Lat: {lat:.6f}<br>
+            Lon: {lon:.6f}</small>
+        </div>
+        """
+
+# Custo "infinito" usado na programação dinâmica de Held–Karp
+_INFINITO = 1 << 62
+
+
+if NUMBA_DISPONIVEL:
+    @njit(parallel=True, cache=True)
+    def _haversine_matrix_numba(lon, lat, raio):
+        """Kernel Numba de `haversine_matrix`, paralelizado por linhas"""
+        n = lon.shape[0]
+        dist = np.empty((n, n), dtype=np.int64)
+        for i in prange(n):
+            cos_i = np.cos(lat[i])
+            for j in range(n):
+                a = (np.sin((lat[i] - lat[j]) / 2) ** 2
+                     + cos_i * np.cos(lat[j]) * np.sin((lon[i] - lon[j]) / 2) ** 2)
+                dist[i, j] = np.int64(raio * 2 * np.arcsin(np.sqrt(a)))
+        return dist
+
+
+def haversine_matrix(pts_lonlat):
+    """
+    Calcula a matriz de distâncias geodésicas (haversine) entre todos os pontos
+    
+    Usa broadcasting do NumPy para calcular as N×N distâncias de uma vez,
+    considerando a curvatura da Terra (raio médio de 6.371 km). Para muitos
+    pontos, usa um kernel Numba paralelo quando o Numba está instalado.
+    
+    Args:
+        pts_lonlat: Lista ou array de coordenadas [[lon1, lat1], [lon2, lat2], ...]
+    
+    Returns:
+        np.ndarray: Matriz N×N (int64) com as distâncias em metros
+    
+    Exemplo:
+        >>> haversine_matrix([[-53.45, -22.08], [-53.36, -22.26]])
+        array([[    0, 22056],
+               [22056,     0]])
+    """
+    pts = np.asarray(pts_lonlat, dtype=np.float64)
+    lon, lat = np.radians(pts[:, 0]), np.radians(pts[:, 1])
+    if NUMBA_DISPONIVEL and len(pts) >= LIMITE_MATRIZ_NUMBA:
+        return _haversine_matrix_numba(
+            np.ascontiguousarray(lon), np.ascontiguousarray(lat), RAIO_TERRA_M
+        )
+    return _haversine(lon[:, None], lat[:, None], lon[None, :], lat[None, :])
+
+
+def haversine_pares(origens_lonlat, destinos_lonlat):
+    """
+    Calcula a distância haversine entre pares correspondentes de pontos
+    
+    Versão O(N) de `haversine_matrix` para quando só interessam as distâncias
+    origens[i] → destinos[i] (por exemplo, os trechos de uma rota).
+    
+    Args:
+        origens_lonlat: Lista ou array (N×2) de coordenadas [[lon, lat], ...]
+        destinos_lonlat: Lista ou array (N×2) de coordenadas [[lon, lat], ...]
+    
+    Returns:
+        np.ndarray: Vetor com N distâncias (int64) em metros
+    
+    Exemplo:
+        >>> haversine_pares([[-53.45, -22.08]], [[-53.36, -22.26]])
+        array([22056])
+    """
+    origens = np.radians(np.asarray(origens_lonlat, dtype=np.float64))
+    destinos = np.radians(np.asarray(destinos_lonlat, dtype=np.float64))
+    return _haversine(origens[:, 0], origens[:, 1], destinos[:, 0], destinos[:, 1])
+
+
+def _haversine(lon1, lat1, lon2, lat2):
+    """Fórmula de haversine vetorizada (entradas em radianos, saída em metros int64)"""
+    a = np.sin((lat1 - lat2) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon1 - lon2) / 2) ** 2
+    return (RAIO_TERRA_M * 2 * np.arcsin(np.sqrt(a))).astype(np.int64)
+
+
+def _held_karp(dist_matrix):
+    """
+    Resolve o TSP de forma exata por programação dinâmica sobre bitmasks
+    
+    Complexidade O(N²·2^N): adequado apenas para poucos pontos. A rota
+    começa e termina no ponto 0.
+    
+    Args:
+        dist_matrix: Matriz N×N de inteiros (distâncias em metros), N >= 2
+    
+    Returns:
+        tuple: (rota, custo) - array com N+1 índices e custo total em metros
+    """
+    n = dist_matrix.shape[0]
+    completo = 1 << n
+    custo = np.full((completo, n), _INFINITO, dtype=np.int64)
+    anterior = np.full((completo, n), -1, dtype=np.int8)
+    custo[1, 0] = 0
+    
+    # Todo subconjunto válido contém o ponto de partida (bit 0)
+    for mask in range(1, completo, 2):
+        for u in range(n):
+            atual = custo[mask, u]
+            if atual >= _INFINITO:
+                continue
+            for v in range(n):
+                if mask & (1 << v):
+                    continue
+                proximo = mask | (1 << v)
+                candidato = atual + dist_matrix[u, v]
+                if candidato < custo[proximo, v]:
+                    custo[proximo, v] = candidato
+                    anterior[proximo, v] = u
+    
+    # Fechar o ciclo voltando ao ponto 0
+    melhor = _INFINITO
+    ultimo = 0
+    for u in range(1, n):
+        candidato = custo[completo - 1, u] + dist_matrix[u, 0]
+        if candidato < melhor:
+            melhor = candidato
+            ultimo = u
+    
+    # Reconstruir a rota de trás para frente
+    rota = np.zeros(n + 1, dtype=np.int64)
+    mask = completo - 1
+    u = ultimo
+    for k in range(n - 1, 0, -1):
+        rota[k] = u
+        proximo_u = int(anterior[mask, u])
+        mask ^= 1 << u
+        u = proximo_u
+    
+    return rota, melhor
+
+
+if NUMBA_DISPONIVEL:
+    _held_karp = njit(cache=True)(_held_karp)
+
 
 def distancia_euclidiana(a, b):
     """
-    Calcula distância euclidiana entre dois pontos geográficos
+    Calcula a distância entre dois pontos geográficos
+    
+    Mantida por compatibilidade: usa a fórmula de haversine de
+    `haversine_matrix` em vez da distância plana em graus.
     
     Args:
         a: Lista [longitude, latitude] do ponto A
         b: Lista [longitude, latitude] do ponto B
     
     Returns:
-        int: Distância aproximada em metros
+        int: Distância em metros
     
     Exemplo:
         >>> distancia_euclidiana([-53.45, -22.08], [-53.36, -22.26])
-        20000  # aproximadamente 20km
+        22056  # aproximadamente 22km
     """
-    return int(math.hypot(a[0] - b[0], a[1] - b[1]) * 1000)
+    return int(haversine_matrix([a, b])[0, 1])
 
 
 def otimizar_rota(pontos_coordenadas):
@@ -41,8 +233,21 @@ def otimizar_rota(pontos_coordenadas):
     Este algoritmo resolve o problema do Caixeiro Viajante (TSP)
     encontrando a rota mais curta que visita todos os pontos.
     
+    A estratégia depende do número de pontos:
+        - 2 ou 3 pontos: o único ciclo possível, sem nenhum solver
+        - Até LIMITE_HELD_KARP pontos: solução exata por Held–Karp
+          (programação dinâmica O(N²·2^N), compilada com Numba se disponível)
+        - Acima disso: OR-Tools com solução inicial PATH_CHEAPEST_ARC
+          refinada por Guided Local Search, com limite de tempo de
+          min(30, 1 + N // 10) segundos
+    
+    Atenção: o Guided Local Search não termina sozinho, então acima de
+    LIMITE_HELD_KARP pontos a chamada sempre leva o limite de tempo inteiro
+    (ex.: 3 s para 20 pontos, 7 s para 60), em troca de rotas alguns
+    por cento mais curtas que a solução inicial.
+    
     Args:
-        pontos_coordenadas: Lista de coordenadas no formato [[lon1, lat1], [lon2, lat2], ...]
+        pontos_coordenadas: Lista ou array (N×2) de coordenadas no formato [[lon1, lat1], [lon2, lat2], ...]
     
     Returns:
         tuple: (sequencia_otimizada, distancia_total)
@@ -51,7 +256,7 @@ def otimizar_rota(pontos_coordenadas):
     
     Raises:
         RuntimeError: Se não for possível encontrar uma solução
-        ValueError: Se houver menos de 2 pontos
+        ValueError: Se houver menos de 2 pontos ou coordenadas inválidas (NaN/infinito)
     
     Exemplo:
         >>> pontos = [[-53.45, -22.08], [-53.36, -22.26], [-46.30, -23.97]]
@@ -59,30 +264,47 @@ def otimizar_rota(pontos_coordenadas):
         >>> print(sequencia)
         [0, 1, 2, 0]  # Volta ao início
         >>> print(f"{distancia:.2f} km")
-        850.45 km
+        1529.75 km
     """
     if len(pontos_coordenadas) < 2:
         raise ValueError("São necessários pelo menos 2 pontos para otimizar")
     
+    pts = np.asarray(pontos_coordenadas, dtype=np.float64)
+    
+    # NaN viraria um inteiro arbitrário na matriz e geraria uma rota errada sem erro
+    if not np.isfinite(pts).all():
+        raise ValueError("Todas as coordenadas devem ter longitude e latitude válidas")
+    
+    # Com 2 ou 3 pontos só existe um ciclo (a menos do sentido): basta medi-lo
+    if len(pts) <= 3:
+        sequencia_otimizada = list(range(len(pts))) + [0]
+        dist_matrix = haversine_matrix(pts)
+        distancia_total = int(dist_matrix[sequencia_otimizada[:-1], sequencia_otimizada[1:]].sum())
+        return sequencia_otimizada, distancia_total / 1000
+    
     # Criar matriz de distâncias
-    size = len(pontos_coordenadas)
-    dist_matrix = [
-        [distancia_euclidiana(pontos_coordenadas[i], pontos_coordenadas[j]) 
-         for j in range(size)] 
-        for i in range(size)
-    ]
+    dist_matrix = np.ascontiguousarray(haversine_matrix(pts), dtype=np.int64)
+    
+    size = len(dist_matrix)
+    
+    # Poucos pontos: solução exata, sem o custo de montar o modelo OR-Tools
+    if size <= LIMITE_HELD_KARP:
+        rota, custo = _held_karp(dist_matrix)
+        return rota.tolist(), int(custo) / 1000
+    
+    # O callback é chamado pelo OR-Tools a cada arco avaliado; listas aninhadas
+    # de inteiros Python evitam a conversão de escalares NumPy nesse caminho
+    custos = dist_matrix.tolist()
     
     # Configurar gerenciador de índices OR-Tools
     # Parâmetros: número de nós, número de veículos, ponto de partida
-    manager = pywrapcp.RoutingIndexManager(len(dist_matrix), 1, 0)
+    manager = pywrapcp.RoutingIndexManager(size, 1, 0)
     routing = pywrapcp.RoutingModel(manager)
     
     # Callback de distância
     def distance_callback(from_index, to_index):
         """Retorna a distância entre dois nós"""
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return dist_matrix[from_node][to_node]
+        return custos[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
     
     # Registrar callback
     transit_callback_index = routing.RegisterTransitCallback(distance_callback)
@@ -93,9 +315,12 @@ def otimizar_rota(pontos_coordenadas):
     search_parameters.first_solution_strategy = (
         routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
     )
+    search_parameters.local_search_metaheuristic = (
+        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    )
     
-    # Adicionar limite de tempo para evitar travamentos
-    search_parameters.time_limit.seconds = 30
+    # Guided Local Search só para no limite de tempo: orçamento curto, escalado com o tamanho
+    search_parameters.time_limit.seconds = min(30, 1 + size // 10)
     
     # Resolver o problema
     solution = routing.SolveWithParameters(search_parameters)
@@ -118,10 +343,79 @@ def otimizar_rota(pontos_coordenadas):
     return sequencia_otimizada, distancia_total
 
 
+def _consultar_rota(api_key, chave_hash, coordenadas, profile):
+    """
+    Consulta o endpoint directions do OpenRouteService
+    
+    A chave da API fica fora da chave do cache (apenas seu hash entra), e
+    erros são propagados como exceção para que nunca sejam memorizados.
+    """
+    cliente = ors.Client(key=api_key)
+    return cliente.directions(
+        coordinates=coordenadas,
+        profile=profile,
+        format='geojson',
+        instructions=True,
+        elevation=False
+    )
+
+
+_consultar_rota_cache = memoria.cache(_consultar_rota, ignore=['api_key'])
+
+
+def _unir_trechos(trechos):
+    """
+    Junta as respostas GeoJSON de trechos consecutivos em uma única rota
+    
+    Cada trecho começa no último ponto do anterior; essa coordenada repetida
+    é descartada e os índices de `way_points` são deslocados de acordo.
+    
+    Args:
+        trechos: Lista de respostas GeoJSON do endpoint directions, em ordem
+    
+    Returns:
+        dict: GeoJSON no mesmo formato de uma resposta única
+    """
+    coordenadas, way_points, segmentos = [], [], []
+    distancia = duracao = 0
+    
+    for k, trecho in enumerate(trechos):
+        feature = trecho['features'][0]
+        coords_trecho = feature['geometry']['coordinates']
+        properties = feature.get('properties', {})
+        summary = properties.get('summary', {})
+        
+        deslocamento = len(coordenadas) - 1 if k else 0
+        inicio = 1 if k else 0
+        coordenadas.extend(coords_trecho[inicio:])
+        way_points.extend(w + deslocamento for w in properties.get('way_points', [])[inicio:])
+        segmentos.extend(properties.get('segments', []))
+        distancia += summary.get('distance', 0)
+        duracao += summary.get('duration', 0)
+    
+    primeira = trechos[0]['features'][0]
+    feature = {
+        **{chave: valor for chave, valor in primeira.items() if chave != 'bbox'},
+        'geometry': {**primeira['geometry'], 'coordinates': coordenadas},
+        'properties': {
+            **primeira.get('properties', {}),
+            'segments': segmentos,
+            'summary': {'distance': distancia, 'duration': duracao},
+            'way_points': way_points
+        }
+    }
+    caminhos = {chave: valor for chave, valor in trechos[0].items() if chave != 'bbox'}
+    caminhos['features'] = [feature]
+    return caminhos
+
+
 def obter_rota_real(api_key, pontos_otimizados, profile='driving-car'):
     """
     Obtém a rota real pelas estradas usando OpenRouteService
     
+    Rotas com mais de LIMITE_COORDENADAS_ORS pontos são divididas em trechos
+    consecutivos (com um ponto em comum), consultados em paralelo e unidos.
+    
     Args:
         api_key: Chave da API OpenRouteService
         pontos_otimizados: Lista de coordenadas na ordem otimizada [[lon, lat], ...]
@@ -137,15 +431,29 @@ def obter_rota_real(api_key, pontos_otimizados, profile='driving-car'):
         ...     print(f"Distância real: {distancia_real/1000:.2f} km")
     """
     try:
-        cliente = ors.Client(key=api_key)
-        caminhos = cliente.directions(
-            coordinates=pontos_otimizados,
-            profile=profile,
-            format='geojson',
-            instructions=True,
-            elevation=False
-        )
-        return caminhos
+        # Descartar respostas vencidas e manter o cache dentro do limite de tamanho
+        memoria.reduce_size(bytes_limit=LIMITE_CACHE_BYTES, age_limit=VALIDADE_CACHE)
+        
+        chave_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        
+        if len(pontos_otimizados) <= LIMITE_COORDENADAS_ORS:
+            return _consultar_rota_cache(api_key, chave_hash, pontos_otimizados, profile)
+        
+        # Janelas de até LIMITE_COORDENADAS_ORS pontos, cada uma começando no fim da anterior
+        passo = LIMITE_COORDENADAS_ORS - 1
+        janelas = [
+            pontos_otimizados[inicio:inicio + LIMITE_COORDENADAS_ORS]
+            for inicio in range(0, len(pontos_otimizados) - 1, passo)
+        ]
+        
+        # Requisições HTTP liberam o GIL: threads sobrepõem a latência dos trechos
+        with ThreadPoolExecutor(max_workers=MAX_REQUISICOES_ORS) as executor:
+            trechos = list(executor.map(
+                lambda janela: _consultar_rota_cache(api_key, chave_hash, janela, profile),
+                janelas
+            ))
+        
+        return _unir_trechos(trechos)
     except ors.exceptions.ApiError as e:
         print(f"Erro na API OpenRouteService: {e}")
         return None
@@ -154,12 +462,47 @@ def obter_rota_real(api_key, pontos_otimizados, profile='driving-car'):
         return None
 
 
+@lru_cache(maxsize=32)
+def _mapa_base(centro):
+    """
+    Cria o mapa base com camadas e plugins, sem marcadores nem rota
+    
+    Fica em cache por centro; `gerar_mapa` trabalha sobre uma cópia, então o
+    objeto em cache nunca é modificado.
+    
+    Args:
+        centro: Tupla (lat, lon) do centro do mapa
+    
+    Returns:
+        folium.Map: Mapa base
+    """
+    mapa = folium.Map(
+        location=list(centro),
+        zoom_start=6,
+        control_scale=True,
+        tiles='OpenStreetMap'
+    )
+    
+    # Adicionar camadas de mapa adicionais
+    folium.TileLayer('cartodbpositron', name='Mapa Claro').add_to(mapa)
+    folium.TileLayer('cartodbdark_matter', name='Mapa Escuro').add_to(mapa)
+    
+    # Adicionar controles
+    folium.LatLngPopup().add_to(mapa)
+    
+    # Adicionar minimapa e tela cheia
+    plugins.MiniMap(toggle_display=True).add_to(mapa)
+    plugins.Fullscreen().add_to(mapa)
+    
+    return mapa
+
+
 def gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia_otimizada, caminhos=None):
     """
     Gera mapa interativo com Folium mostrando a rota otimizada
     
     Args:
-        pontos_coordenadas: Lista de coordenadas originais [[lon, lat], ...]
+        pontos_coordenadas: Lista ou array (N×2) de coordenadas originais [[lon, lat], ...]
         rotas_nomes: Lista com nomes dos pontos
         sequencia_otimizada: Lista de índices na ordem otimizada
         caminhos: GeoJSON da rota real (opcional)
@@ -171,53 +514,52 @@ def gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia_otimizada, caminhos=No
         >>> mapa = gerar_mapa(pontos, nomes, sequencia, rota_real)
         >>> mapa.save('mapa_rota.html')
     """
-    # Determinar centro do mapa (primeiro ponto da sequência)
-    primeiro_idx = sequencia_otimizada[0]
-    centro = list(reversed(pontos_coordenadas[primeiro_idx]))
+    # Converter coordenadas de [lon, lat] para [lat, lon] uma única vez
+    pts_latlon = np.asarray(pontos_coordenadas, dtype=np.float64)[:, ::-1]
     
-    # Criar mapa base
-    mapa = folium.Map(
-        location=centro,
-        zoom_start=6,
-        control_scale=True,
-        tiles='OpenStreetMap'
-    )
+    # Determinar centro do mapa (primeiro ponto da sequência, arredondado
+    # para 0,1° para que rotas próximas reaproveitem o mesmo mapa base)
+    centro = tuple(np.round(pts_latlon[sequencia_otimizada[0]], 1).tolist())
     
-    # Adicionar marcadores para cada ponto
-    for i, idx in enumerate(sequencia_otimizada):
-        # Converter coordenadas de [lon, lat] para [lat, lon]
-        cordenadas = list(reversed(pontos_coordenadas[idx]))
-        nome_ponto = rotas_nomes[idx]
-        
-        # Determinar cor do marcador baseado na ordem
-        if i == 0:
-            cor = 'green'  # Início
-            icone = 'play'
-        elif i == len(sequencia_otimizada) - 1:
-            cor = 'red'  # Fim
-            icone = 'stop'
-        else:
-            cor = 'blue'  # Pontos intermediários
-            icone = 'info-sign'
-        
-        # Criar popup com informações
-        popup_html = f"""
-        <div style="font-family: Arial; min-width: 150px;">
-            <h4 style="margin: 0; color: {cor};">Parada #{i + 1}</h4>
-            <hr style="margin: 5px 0;">
-            <b>{nome_ponto}</b><br>
-            <small>Lat: {cordenadas[0]:.6f}<br>
-            Lon: {cordenadas[1]:.6f}</small>
-        </div>
-        """
-        
-        # Adicionar marcador ao mapa
-        folium.Marker(
-            cordenadas,
-            popup=folium.Popup(popup_html, max_width=200),
-            tooltip=f"#{i + 1} - {nome_ponto}",
-            icon=folium.Icon(icon=icone, color=cor, prefix='fa')
-        ).add_to(mapa)
+    # Copiar o mapa base em cache (camadas e plugins já montados)
+    mapa = copy.deepcopy(_mapa_base(centro))
+    
+    # Agrupar os marcadores em uma única camada adicionada ao mapa no final
+    marcadores = folium.FeatureGroup(name='Paradas')
+    
+    if len(sequencia_otimizada) > LIMITE_MARCADORES_INDIVIDUAIS:
+        # Muitas paradas: cluster renderizado no navegador a partir dos dados
+        plugins.FastMarkerCluster(pts_latlon[sequencia_otimizada].tolist()).add_to(marcadores)
+    else:
+        for i, idx in enumerate(sequencia_otimizada):
+            cordenadas = pts_latlon[idx].tolist()
+            nome_ponto = rotas_nomes[idx]
+            
+            # Determinar cor do marcador baseado na ordem
+            if i == 0:
+                cor = 'green'  # Início
+                icone = 'play'
+            elif i == len(sequencia_otimizada) - 1:
+                cor = 'red'  # Fim
+                icone = 'stop'
+            else:
+                cor = 'blue'  # Pontos intermediários
+                icone = 'info-sign'
+            
+            # Criar popup com informações
+            popup_html = POPUP_PARADA_HTML.format(
+                cor=cor, ordem=i + 1, nome=nome_ponto,
+                lat=cordenadas[0], lon=cordenadas[1]
+            )
+            
+            marcadores.add_child(folium.Marker(
+                cordenadas,
+                popup=folium.Popup(popup_html, max_width=200),
+                tooltip=f"#{i + 1} - {nome_ponto}",
+                icon=folium.Icon(icon=icone, color=cor, prefix='fa')
+            ))
+    
+    mapa.add_child(marcadores)
     
     # Adicionar rota ao mapa
     if caminhos and 'features' in caminhos and len(caminhos['features']) > 0:
@@ -235,7 +577,7 @@ def gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia_otimizada, caminhos=No
         
         # Desenhar rota
         folium.PolyLine(
-            locations=[[coord[1], coord[0]] for coord in coords],
+            locations=np.asarray(coords)[:, 1::-1].tolist(),
             color='#2E86DE',
             weight=4,
             opacity=0.8,
@@ -243,9 +585,8 @@ def gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia_otimizada, caminhos=No
         ).add_to(mapa)
     else:
         # Usar linhas retas entre os pontos (fallback)
-        pontos_rota = [list(reversed(pontos_coordenadas[i])) for i in sequencia_otimizada]
         folium.PolyLine(
-            locations=pontos_rota,
+            locations=pts_latlon[sequencia_otimizada].tolist(),
             color='#EE5A6F',
             weight=3,
             opacity=0.6,
@@ -253,18 +594,8 @@ def gerar_mapa(pontos_coordenadas, rotas_nomes, sequencia_otimizada, caminhos=No
             tooltip='Rota aproximada (linha reta)'
         ).add_to(mapa)
     
-    # Adicionar camadas de mapa adicionais
-    folium.TileLayer('cartodbpositron', name='Mapa Claro').add_to(mapa)
-    folium.TileLayer('cartodbdark_matter', name='Mapa Escuro').add_to(mapa)
-    
-    # Adicionar controles
+    # O controle de camadas vem por último: ele referencia as camadas já criadas
     folium.LayerControl().add_to(mapa)
-    folium.LatLngPopup().add_to(mapa)
-    
-    # Adicionar medidor de escala
-    from folium import plugins
-    plugins.MiniMap(toggle_display=True).add_to(mapa)
-    plugins.Fullscreen().add_to(mapa)
     
     return mapa
 
@@ -274,7 +605,7 @@ def calcular_estatisticas_rota(pontos_coordenadas, sequencia_otimizada, caminhos
     Calcula estatísticas detalhadas da rota
     
     Args:
-        pontos_coordenadas: Lista de coordenadas
+        pontos_coordenadas: Lista ou array (N×2) de coordenadas
         sequencia_otimizada: Sequência de índices
         caminhos: GeoJSON da rota real (opcional)
     
@@ -294,15 +625,10 @@ def calcular_estatisticas_rota(pontos_coordenadas, sequencia_otimizada, caminhos
         stats['tempo_horas'] = summary.get('duration', 0) / 3600
         stats['tempo_minutos'] = summary.get('duration', 0) / 60
     else:
-        # Calcular distância euclidiana total
-        distancia_total = 0
-        for i in range(len(sequencia_otimizada) - 1):
-            idx_atual = sequencia_otimizada[i]
-            idx_proximo = sequencia_otimizada[i + 1]
-            distancia_total += distancia_euclidiana(
-                pontos_coordenadas[idx_atual],
-                pontos_coordenadas[idx_proximo]
-            )
+        # Calcular distância total somando apenas os trechos da rota
+        pts = np.asarray(pontos_coordenadas, dtype=np.float64)
+        sequencia = np.asarray(sequencia_otimizada)
+        distancia_total = int(haversine_pares(pts[sequencia[:-1]], pts[sequencia[1:]]).sum())
         
         stats['distancia_km'] = distancia_total / 1000
         stats['tempo_horas'] = stats['distancia_km'] / 60  # Aproximação
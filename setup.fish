@@ -26,7 +26,6 @@ pip install --upgrade pip
 # Instalar dependências
 echo "📥 Instalando dependências..."
 pip install streamlit
-pip install streamlit-folium
 pip install openrouteservice
 pip install ortools
 pip install folium
@@ -38,7 +37,7 @@ pip list | grep -E "streamlit|folium|ortools|openrouteservice"
 
 # Testar
 echo "🧪 Testando importações..."
-python -c "from streamlit_folium import st_folium; print('✅ streamlit-folium OK')"
+python -c "import folium; print('✅ folium OK')"
 
 echo ""
 echo "✅ Pronto! Execute:"